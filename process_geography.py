@@ -1,84 +1,331 @@
 import os
+import asyncio
+import shelve
+import time
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter, Retry
 import folium
 from dotenv import load_dotenv
 from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut
+from geopy.exc import GeocoderTimedOut, GeocoderServiceError
 import pygris
+import pandas as pd
 import geopandas as gpd
+import pyproj
+import shapely
 from shapely.geometry import Point
+from shapely.ops import transform as shapely_transform
 import matplotlib.pyplot as plt
 
+GEO_CACHE_PATH = "./.geo_cache"
+BG_CACHE_DIR = "./.bg_cache"
+METERS_PER_MILE = 1609.344
+
 class GeocodingMap:
     def __init__(self):
         load_dotenv()
         self.access_token = os.getenv("MAPBOX_ACCESS_TOKEN")
-        
+
         if not self.access_token:
             raise ValueError("Mapbox access token not found in environment variables")
-        
+
         self.geolocator = Nominatim(user_agent="my_agent")
 
+        # Reuse one session so repeated calls keep the TLS connection alive
+        self._session = requests.Session()
+        retries = Retry(total=3, backoff_factor=0.3,
+                        status_forcelist=[429, 500, 502, 503, 504])
+        self._session.mount("https://",
+                            HTTPAdapter(pool_connections=8, pool_maxsize=16,
+                                        max_retries=retries))
+
+        # In-memory cache backed by a shelve file so repeat lookups skip the network
+        self._memory_cache = {}
+
+        # Cached transformers from local buffer frames back to WGS84
+        self._to_wgs84 = {}
+
+        # Block group boundaries already fetched this session
+        self._bg_cache = {}
+
+        # Nominatim's usage policy is 1 request/s, so concurrent batches must
+        # take reverse lookups one at a time
+        self._nominatim_semaphore = asyncio.Semaphore(1)
+
+    def _cache_lookup(self, key):
+        # Check memory first, then the on-disk cache
+        if key in self._memory_cache:
+            return self._memory_cache[key]
+        try:
+            with shelve.open(GEO_CACHE_PATH) as db:
+                if key in db:
+                    entry = db[key]
+                    self._memory_cache[key] = entry
+                    return entry
+        except OSError as e:
+            print(f"Warning: could not read geocode cache: {e}")
+        return None
+
+    def _cache_store(self, key, value):
+        entry = {'value': value, 'timestamp': time.time()}
+        self._memory_cache[key] = entry
+        try:
+            with shelve.open(GEO_CACHE_PATH) as db:
+                db[key] = entry
+        except OSError as e:
+            print(f"Warning: could not write geocode cache: {e}")
+
     def get_location_info(self, latitude, longitude):
+        # Round the coordinates so nearby repeat lookups share a cache entry
+        cache_key = f"reverse:{round(latitude, 5)},{round(longitude, 5)}"
+        cached = self._cache_lookup(cache_key)
+        if cached is not None:
+            return cached['value']
+
         try:
             location = self.geolocator.reverse(f"{latitude}, {longitude}")
             address = location.raw['address']
             
             county = address.get('county', '')
             state = address.get('state', '')
-            
+
+            self._cache_store(cache_key, (county, state))
             return county, state
         except GeocoderTimedOut:
             print("The geocoding service timed out. Please try again.")
             return None, None
+        except GeocoderServiceError as e:
+            print(f"Reverse geocoding failed: {e}")
+            return None, None
 
     def geocode_address(self, address):
+        cache_key = f"geocode:{address.strip().lower()}"
+        cached = self._cache_lookup(cache_key)
+        if cached is not None:
+            return cached['value']
+
         base_url = "https://api.mapbox.com/geocoding/v5/mapbox.places/"
         url = f"{base_url}{address}.json?access_token={self.access_token}"
-        
-        response = requests.get(url)
-        
+
+        response = self._session.get(url, timeout=(3.05, 10))
+
         if response.status_code == 200:
             data = response.json()
             if data['features']:
                 coordinates = data['features'][0]['center']
-                return {
+                result = {
                     'longitude': coordinates[0],
                     'latitude': coordinates[1]
                 }
+                self._cache_store(cache_key, result)
+                return result
             else:
                 return None
         else:
             print(f"Error: {response.status_code}")
             return None
 
-    def get_block_group_data(self, state, county):
+    def geocode_addresses(self, addresses):
+        # Geocode several addresses with one Mapbox batch request instead of
+        # one round-trip each. Only cache misses are sent to the API.
+        results = {}
+        pending = []
+        for address in addresses:
+            cached = self._cache_lookup(f"geocode:{address.strip().lower()}")
+            if cached is not None:
+                results[address] = cached['value']
+            else:
+                pending.append(address)
+
+        url = ("https://api.mapbox.com/search/geocode/v6/batch"
+               f"?access_token={self.access_token}")
+
+        # The batch endpoint accepts at most 50 queries per request
+        for start in range(0, len(pending), 50):
+            chunk = pending[start:start + 50]
+            body = [{"q": address, "limit": 1} for address in chunk]
+
+            response = self._session.post(url, json=body, timeout=(3.05, 30))
+
+            if response.status_code != 200:
+                print(f"Batch geocoding failed ({response.status_code}); "
+                      "falling back to per-address requests.")
+                for address in chunk:
+                    results[address] = self.geocode_address(address)
+                continue
+
+            # The response carries one FeatureCollection per query, in order
+            for address, entry in zip(chunk, response.json().get('batch', [])):
+                features = entry.get('features')
+                if features:
+                    coordinates = features[0]['geometry']['coordinates']
+                    result = {
+                        'longitude': coordinates[0],
+                        'latitude': coordinates[1]
+                    }
+                    self._cache_store(f"geocode:{address.strip().lower()}", result)
+                    results[address] = result
+                else:
+                    results[address] = None
+
+        return [results.get(address) for address in addresses]
+
+    async def geocode_address_async(self, address, session):
+        cache_key = f"geocode:{address.strip().lower()}"
+        cached = self._cache_lookup(cache_key)
+        if cached is not None:
+            return cached['value']
+
+        base_url = "https://api.mapbox.com/geocoding/v5/mapbox.places/"
+        url = f"{base_url}{address}.json?access_token={self.access_token}"
+
+        async with session.get(url) as response:
+            if response.status == 200:
+                data = await response.json()
+                if data['features']:
+                    coordinates = data['features'][0]['center']
+                    result = {
+                        'longitude': coordinates[0],
+                        'latitude': coordinates[1]
+                    }
+                    self._cache_store(cache_key, result)
+                    return result
+                else:
+                    return None
+            else:
+                print(f"Error: {response.status}")
+                return None
+
+    async def process_address_async(self, address, session):
+        # Match the sync contract: any failure prints and yields None for this
+        # address instead of aborting the whole gather'd batch
         try:
-            bg_data = pygris.block_groups(state=state, county=county, year=2022, cb=True)
-            return bg_data
+            result = await self.geocode_address_async(address, session)
+            if not result:
+                print(f"Geocoding failed for {address}.")
+                return None
+
+            latitude = result['latitude']
+            longitude = result['longitude']
+
+            # Nominatim and pygris are blocking clients, so run them off the
+            # event loop; the semaphore keeps reverse lookups serialized so a
+            # batch doesn't hammer Nominatim past its 1 req/s policy
+            async with self._nominatim_semaphore:
+                county, state = await asyncio.to_thread(self.get_location_info,
+                                                        latitude, longitude)
+            if not county or not state:
+                print(f"Couldn't retrieve county and state for {address}.")
+                return None
+
+            block_group_data = await asyncio.to_thread(self.get_block_group_data, state, county)
+            if block_group_data is None:
+                print(f"Failed to retrieve block group data for {address}.")
+                return None
+
+            clipped_bg, buffer = self.create_buffer_and_clip(latitude, longitude, block_group_data)
+        except Exception as e:
+            print(f"Error processing {address}: {e}")
+            return None
+
+        return {
+            'address': address,
+            'latitude': latitude,
+            'longitude': longitude,
+            'county': county,
+            'state': state,
+            'clipped_bg': clipped_bg,
+            'buffer': buffer
+        }
+
+    async def _process_addresses_async(self, addresses):
+        connector = aiohttp.TCPConnector(limit=20)
+        timeout = aiohttp.ClientTimeout(total=30)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            tasks = [self.process_address_async(address, session) for address in addresses]
+            return await asyncio.gather(*tasks)
+
+    def process_addresses(self, addresses):
+        # Warm the geocode cache with one batch request when several addresses
+        # come in, then run the per-address pipelines concurrently so
+        # wall-clock time is the slowest address rather than the sum of all
+        if len(addresses) > 1:
+            self.geocode_addresses(addresses)
+        return asyncio.run(self._process_addresses_async(addresses))
+
+    def get_block_group_data(self, state, county, year=2022):
+        # Boundaries for a county/year never change, so cache them in memory
+        # and on disk instead of re-downloading the shapefile each request
+        cache_key = (str(state).strip().lower(), str(county).strip().lower(), year)
+        if cache_key in self._bg_cache:
+            return self._bg_cache[cache_key]
+
+        cache_file = os.path.join(
+            BG_CACHE_DIR, "{}_{}_{}.pkl".format(*cache_key).replace(" ", "_"))
+        if os.path.exists(cache_file):
+            try:
+                bg_data = pd.read_pickle(cache_file)
+                # Cache entries written before CRS normalization may be NAD83
+                if bg_data.crs is not None and bg_data.crs.to_epsg() != 4326:
+                    bg_data = bg_data.to_crs(epsg=4326)
+                bg_data.sindex  # build the STRtree up front, off the request path
+                self._bg_cache[cache_key] = bg_data
+                return bg_data
+            except Exception as e:
+                print(f"Warning: could not read block group cache: {e}")
+
+        try:
+            bg_data = pygris.block_groups(state=state, county=county, year=year, cb=True)
         except Exception as e:
             print(f"Error fetching block group data: {e}")
             return None
 
+        # CB shapefiles come back in NAD83 (EPSG:4269); normalize to WGS84
+        # once here so every downstream CRS check can skip reprojection
+        if bg_data.crs is None:
+            bg_data = bg_data.set_crs(epsg=4326)
+        elif bg_data.crs.to_epsg() != 4326:
+            bg_data = bg_data.to_crs(epsg=4326)
+
+        bg_data.sindex  # build the STRtree up front, off the request path
+        self._bg_cache[cache_key] = bg_data
+        try:
+            os.makedirs(BG_CACHE_DIR, exist_ok=True)
+            bg_data.to_pickle(cache_file)
+        except Exception as e:
+            print(f"Warning: could not write block group cache: {e}")
+
+        return bg_data
+
+    def buffer_in_wgs84(self, latitude, longitude, buffer_miles):
+        # Buffer in a local azimuthal-equidistant frame centered on the point,
+        # so only a single projection call is needed to get back to WGS84
+        key = (round(latitude, 5), round(longitude, 5))
+        transformer = self._to_wgs84.get(key)
+        if transformer is None:
+            local_crs = pyproj.CRS.from_proj4(
+                f"+proj=aeqd +lat_0={latitude} +lon_0={longitude} +x_0=0 +y_0=0")
+            transformer = pyproj.Transformer.from_crs(local_crs, "EPSG:4326",
+                                                      always_xy=True)
+            self._to_wgs84[key] = transformer
+
+        buffer_local = Point(0, 0).buffer(buffer_miles * METERS_PER_MILE)
+        return shapely_transform(transformer.transform, buffer_local)
+
     def create_buffer_and_clip(self, latitude, longitude, block_group_data, buffer_miles=3):
-        # Create a point from the lat/lon
-        point = Point(longitude, latitude)
-        
-        # Create a GeoDataFrame with the point
-        point_gdf = gpd.GeoDataFrame(geometry=[point], crs="EPSG:4326")
-        
-        # Reproject to a projected CRS for accurate buffer
-        point_projected = point_gdf.to_crs(epsg=3857)
-        
-        # Create buffer (3 miles = 4828.03 meters)
-        buffer = point_projected.buffer(4828.03)
-        
-        # Reproject buffer back to WGS84
-        buffer_wgs84 = buffer.to_crs(epsg=4326)
-        
-        # Clip block groups with buffer
-        clipped_bg = gpd.clip(block_group_data, buffer_wgs84)
-        
+        # Build the buffer circle around the point directly in WGS84
+        buffer_geom = self.buffer_in_wgs84(latitude, longitude, buffer_miles)
+        buffer_wgs84 = gpd.GeoSeries([buffer_geom], crs="EPSG:4326")
+
+        # Use the spatial index to prune candidates, then intersect only the
+        # survivors with a single vectorized GEOS call on the raw array
+        idx = block_group_data.sindex.query(buffer_geom, predicate="intersects")
+        clipped_bg = block_group_data.iloc[idx].copy()
+        geoms = shapely.intersection(clipped_bg.geometry.values, buffer_geom)
+        clipped_bg.geometry = geoms
+        clipped_bg = clipped_bg[~shapely.is_empty(geoms)]
+
         return clipped_bg, buffer_wgs84
 
     def plot_clipped_map(self, latitude, longitude, address, county, state, clipped_bg, buffer):
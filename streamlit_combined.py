@@ -3,12 +3,13 @@ import streamlit as st
 from dotenv import load_dotenv
 from train_of_thought_comprehensive_agent_with_latlon import CensusDataFetcher
 from process_geography import GeocodingMap
+import json
+import numpy as np
+import pandas as pd
 import geopandas as gpd
-import folium
-from shapely.geometry import Point
-from streamlit_folium import folium_static
+import shapely
+import pydeck as pdk
 import plotly.graph_objects as go
-import plotly.express as px
 
 class CombinedCensusMap:
     def __init__(self):
@@ -54,105 +55,142 @@ class CombinedCensusMap:
             st.error("Error: 'GEOID' column not found in census_data")
             return None
 
+        # Cast the join key to string once on each side and drop the TIGER
+        # attribute columns we never use, so the merge only moves GEOID + geometry
+        block_group_data = block_group_data[['GEOID', 'geometry']].copy()
+        block_group_data['GEOID'] = block_group_data['GEOID'].astype(str)
+        census_data = census_data.copy()
+        census_data['GEOID'] = census_data['GEOID'].astype(str)
+
+        # Downcast the estimate columns: 64-bit precision is wasted on census
+        # counts and doubles what the merge moves and the browser receives.
+        # to_numeric only narrows when the values fit, so aggregates that
+        # exceed 32-bit range stay 64-bit instead of silently wrapping.
+        for col in census_data.columns:
+            if pd.api.types.is_float_dtype(census_data[col]):
+                census_data[col] = pd.to_numeric(census_data[col], downcast='float')
+            elif pd.api.types.is_integer_dtype(census_data[col]):
+                census_data[col] = pd.to_numeric(census_data[col], downcast='integer')
+
         merged_data = block_group_data.merge(census_data, on='GEOID', how='left')
 
-        # Ensure the CRS is set to EPSG:4326 (WGS84)
-        merged_data = merged_data.to_crs(epsg=4326)
+        # Ensure the CRS is set to EPSG:4326 (WGS84); reprojecting is only
+        # worth a PROJ pipeline when the data isn't already in it
+        if merged_data.crs is None:
+            merged_data = merged_data.set_crs(epsg=4326)
+        elif merged_data.crs.to_epsg() != 4326:
+            merged_data = merged_data.to_crs(epsg=4326)
 
         return latitude, longitude, county, state, merged_data
 
     def create_buffer_and_clip(self, latitude, longitude, data, buffer_miles=5):
-        # Create a point from the lat/lon
-        point = Point(longitude, latitude)
-        
-        # Create a GeoDataFrame with the point
-        point_gdf = gpd.GeoDataFrame(geometry=[point], crs="EPSG:4326")
-        
-        # Ensure the input data is in EPSG:4326
-        data = data.to_crs(epsg=4326)
-        
-        # Reproject to a projected CRS for accurate buffer
-        point_projected = point_gdf.to_crs(epsg=3857)
-        
-        # Create buffer (5 miles = 8046.72 meters)
-        buffer = point_projected.buffer(8046.72)
-        
-        # Reproject buffer back to WGS84
-        buffer_wgs84 = buffer.to_crs(epsg=4326)
-        
-        # Clip data with buffer
-        clipped_data = gpd.clip(data, buffer_wgs84)
-        
+        # process_request already normalizes to EPSG:4326; only reproject if a
+        # caller hands us something else
+        if data.crs is not None and data.crs.to_epsg() != 4326:
+            data = data.to_crs(epsg=4326)
+
+        # Build the buffer circle around the point directly in WGS84
+        buffer_geom = self.geocoding_map.buffer_in_wgs84(latitude, longitude, buffer_miles)
+        buffer_wgs84 = gpd.GeoSeries([buffer_geom], crs="EPSG:4326")
+
+        # Use the spatial index to prune candidates, then intersect only the
+        # survivors with a single vectorized GEOS call on the raw array
+        idx = data.sindex.query(buffer_geom, predicate="intersects")
+        clipped_data = data.iloc[idx].copy()
+        geoms = shapely.intersection(clipped_data.geometry.values, buffer_geom)
+        clipped_data.geometry = geoms
+        clipped_data = clipped_data[~shapely.is_empty(geoms)]
+
         return clipped_data, buffer_wgs84
 
     def plot_map(self, latitude, longitude, address, county, state, merged_data):
         # Create buffer and clip data
         clipped_data, buffer = self.create_buffer_and_clip(latitude, longitude, merged_data)
 
-        # Create a base map with gray tiles
-        m = folium.Map(location=[latitude, longitude], zoom_start=12, 
-                       tiles='CartoDB positron', 
-                       attr='CartoDB')  # 'CartoDB positron' is a light gray basemap
-
-        # Add marker for the address
-        popup_text = f"{address}<br>County: {county}<br>State: {state}"
-        folium.Marker(
-            [latitude, longitude],
-            popup=popup_text,
-            tooltip=address
-        ).add_to(m)
-
-        # Add choropleth layer for clipped data
         variable_name = clipped_data.columns[-1]  # Assume the last column is the census variable
-        choropleth = folium.Choropleth(
-            geo_data=clipped_data.to_json(),
-            name='Census Data',
-            data=clipped_data,
-            columns=['GEOID', variable_name],
-            key_on='feature.properties.GEOID',
-            fill_color='YlOrRd',
-            fill_opacity=0.7,
-            line_opacity=0.2,
-            legend_name=variable_name
-        ).add_to(m)
-
-        # Add popups to the choropleth layer
-        choropleth.geojson.add_child(
-            folium.features.GeoJsonTooltip(
-                fields=['GEOID', variable_name],
-                aliases=['Block Group ID:', f'{variable_name}:'],
-                style=("background-color: white; color: #333333; font-family: arial; font-size: 12px; padding: 10px;")
-            )
-        )
 
-        # Add buffer outline
-        folium.GeoJson(
-            buffer.to_json(),
-            style_function=lambda feature: {
-                'fillColor': 'none',
-                'color': 'red',
-                'weight': 2,
-            },
-            name='5-Mile Buffer'
-        ).add_to(m)
+        # Simplify geometry for display (~20 m tolerance) and encode the
+        # GeoJSON once, instead of shipping full-resolution boundaries
+        display_data = clipped_data.copy()
+        display_data.geometry = display_data.geometry.simplify(0.0002,
+                                                               preserve_topology=True)
+
+        # Precompute a YlOrRd-style fill color per block group so the GPU
+        # layer just reads a property instead of evaluating a color scale
+        values = pd.to_numeric(display_data[variable_name], errors='coerce')
+        vmin, vmax = values.min(), values.max()
+        span = (vmax - vmin) or 1
+        scaled = ((values - vmin) / span).fillna(0)
+        display_data['fill_color'] = [
+            [int(255 - 66 * t), int(255 - 255 * t), int(178 - 140 * t), 180]
+            for t in scaled
+        ]
+
+        census_layer = pdk.Layer(
+            'GeoJsonLayer',
+            data=json.loads(display_data.to_json()),
+            stroked=True,
+            filled=True,
+            get_fill_color='properties.fill_color',
+            get_line_color=[51, 51, 51, 120],
+            line_width_min_pixels=1,
+            pickable=True,
+        )
 
-        folium.LayerControl().add_to(m)
+        buffer_layer = pdk.Layer(
+            'GeoJsonLayer',
+            data=json.loads(buffer.to_json()),
+            stroked=True,
+            filled=False,
+            get_line_color=[255, 0, 0, 200],
+            line_width_min_pixels=2,
+        )
 
-        # Fit the map to the buffer bounds
-        m.fit_bounds(buffer.total_bounds.tolist())
+        marker_layer = pdk.Layer(
+            'ScatterplotLayer',
+            data=[{'position': [longitude, latitude],
+                   'label': f"{address} ({county}, {state})"}],
+            get_position='position',
+            get_fill_color=[0, 90, 200, 230],
+            get_radius=60,
+            radius_min_pixels=4,
+        )
 
-        return m
+        tooltip = {
+            'html': f'<b>Block Group ID:</b> {{GEOID}}<br/>'
+                    f'<b>{variable_name}:</b> {{{variable_name}}}',
+            'style': {'backgroundColor': 'white', 'color': '#333333'}
+        }
+
+        return pdk.Deck(
+            layers=[census_layer, buffer_layer, marker_layer],
+            initial_view_state=pdk.ViewState(latitude=latitude,
+                                             longitude=longitude, zoom=11),
+            map_style='light',
+            tooltip=tooltip
+        )
     
     def plot_histogram(self, data, variable_name):
-        fig = px.histogram(data, x=variable_name, nbins=20,
-                           title=f'Distribution of {variable_name}')
+        # Bin server-side so the page receives 20 bars instead of every raw value
+        values = pd.to_numeric(data[variable_name], errors='coerce').dropna()
+        counts, edges = np.histogram(values, bins=20)
+        centers = (edges[:-1] + edges[1:]) / 2
+
+        fig = go.Figure(go.Bar(x=centers, y=counts, width=np.diff(edges)))
         fig.update_layout(
+            title=f'Distribution of {variable_name}',
             xaxis_title=variable_name,
             yaxis_title='Frequency',
             bargap=0.1
         )
         return fig
 
+@st.cache_resource
+def get_combined_census_map():
+    # One shared instance per server process, so every rerun and session
+    # reuses the same HTTP session, geocode cache and block group cache
+    return CombinedCensusMap()
+
 def main():
     st.title("Discover Your Neighborhood's Demographics")
 
@@ -162,7 +200,7 @@ def main():
     The app will generate a map showing the requested information for the area within a 5-mile radius of the address.
     """)
 
-    combined_census_map = CombinedCensusMap()
+    combined_census_map = get_combined_census_map()
 
     # User input
     address = st.text_input("Enter an address:")
@@ -177,8 +215,8 @@ def main():
                 st.success("Data processed successfully!")
 
                 # Create and display the map
-                m = combined_census_map.plot_map(latitude, longitude, address, county, state, merged_data)
-                folium_static(m)
+                deck = combined_census_map.plot_map(latitude, longitude, address, county, state, merged_data)
+                st.pydeck_chart(deck, use_container_width=True)
 
                 # Display interactive histogram
                 st.subheader("Data Distribution")
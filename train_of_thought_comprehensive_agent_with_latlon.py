@@ -1,17 +1,69 @@
+import io
 import os
+import re
 from dotenv import load_dotenv
+from functools import lru_cache
 from openai import OpenAI
 import json
 import pandas as pd
 from pygris.data import get_census
 
+@lru_cache(maxsize=None)
+def load_variables(variables_file):
+    # One shared catalog per process; every fetcher gets the same DataFrame,
+    # so treat it as read-only
+    return pd.read_csv(variables_file)
+
 class CensusDataFetcher:
     def __init__(self, variables_file='acs5_variables.csv'):
         load_dotenv()
         self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.df = pd.read_csv(variables_file)
+        self.df = load_variables(variables_file)
+
+        # Parsed agent responses already paid for this session
+        self._agent_cache = {}
+
+        # Precompile one alternation regex over all catalog keywords, mapping
+        # each keyword to the rows it appears in. Matching a request is then a
+        # single scan by the compiled automaton instead of a per-row search.
+        search_text = (self.df['Label'].fillna('') + ' '
+                       + self.df['Concept'].fillna('')).str.lower()
+        self._keyword_rows = {}
+        for row, text in enumerate(search_text):
+            for word in re.findall(r'[a-z]+', text):
+                if len(word) > 3:
+                    self._keyword_rows.setdefault(word, set()).add(row)
+        if self._keyword_rows:
+            keywords = sorted(self._keyword_rows, key=len, reverse=True)
+            self._keyword_pattern = re.compile(
+                r'\b(?:' + '|'.join(map(re.escape, keywords)) + r')\b')
+        else:
+            self._keyword_pattern = None
+
+    def relevant_variables(self, user_request):
+        # Keep only variables whose label or concept shares a keyword with the
+        # request, so the prompt doesn't carry the whole catalog every call.
+        # Fall back to the full table when nothing matches.
+        if self._keyword_pattern is not None:
+            rows = set()
+            for word in self._keyword_pattern.findall(user_request.lower()):
+                rows.update(self._keyword_rows[word])
+            if rows:
+                return self.df.iloc[sorted(rows)]
+        return self.df
 
     def comprehensive_census_agent(self, user_request, state_name, county_name):
+        # Identical requests resolve to identical parameters, so don't re-pay
+        # the LLM round-trip for a repeat
+        cache_key = (user_request.strip().lower(), state_name, county_name)
+        cached = self._agent_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # CSV is denser than the padded to_string table and cheaper to produce
+        variables_buf = io.StringIO()
+        self.relevant_variables(user_request).to_csv(variables_buf, index=False)
+
         prompt = f"""
         Analyze the following user request for census data: "{user_request}"
         The state is {state_name} and the county is {county_name}.
@@ -22,7 +74,7 @@ class CensusDataFetcher:
         2. Interpret Census Variables:
         Based on the user request, determine the appropriate census variable code(s).
         Here are the available census variables:
-        {self.df.to_string(index=False)}
+        {variables_buf.getvalue()}
 
         3. Translate Geography:
         Translate the geography information into the correct format.
@@ -54,18 +106,26 @@ class CensusDataFetcher:
                 {"role": "user", "content": prompt}
             ],
             temperature=0,
+            response_format={"type": "json_object"},
         )
 
         content = response.choices[0].message.content.strip()
-        
+
         try:
+            result = json.loads(content)
+        except json.JSONDecodeError:
+            # Fall back to pulling out the outermost braces if the model
+            # wrapped the JSON in any extra text
             json_start = content.find('{')
             json_end = content.rfind('}') + 1
-            json_str = content[json_start:json_end]
-            result = json.loads(json_str)
-        except json.JSONDecodeError:
-            result = {"error": "Failed to parse response", "raw_response": content}
-        
+            try:
+                result = json.loads(content[json_start:json_end])
+            except json.JSONDecodeError:
+                result = {"error": "Failed to parse response", "raw_response": content}
+
+        if "error" not in result:
+            self._agent_cache[cache_key] = result
+
         return result
 
     def get_census_parameters(self, user_request, state_name, county_name):